@@ -3,23 +3,50 @@
 
 import os
 import io
+import re
+import json
+import shutil
+import mmap
+import time
+import heapq
+import hashlib
+import zipfile
 import tempfile
 from pathlib import Path
-import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import xml.parsers.expat
 
 import streamlit as st
+from lxml import etree
 
 # Set Tesseract path to make OCR functionality work
 import pytesseract
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-from pdf_to_universal_xml import process_pdf  # our backend
+from pdf_to_universal_xml import (  # our backend
+    process_pdf,
+    _get_directory_size_mb,
+    _tesseract_info,
+    _safe_write_text,
+    _manifest_json,
+    NATIVE_IMAGE_EXTS,
+)
+
+PREVIEW_MAX_PAGES = 50
+DEFAULT_OUTDIR = str(Path.cwd() / "output")
+IMAGE_SUFFIXES = tuple(f".{ext}" for ext in NATIVE_IMAGE_EXTS)  # embedded images keep their own format
 
 st.set_page_config(page_title="Universal PDF Extractor (Large-file Friendly)", page_icon="📄", layout="wide")
 
 st.title("📄 Universal PDF Extractor (Large-file Friendly)")
 st.caption("Process huge PDFs: text + OCR fallback + images + tables → Combined XML")
 
+@st.cache_resource(show_spinner=False)
+def _ocr_probe() -> dict:
+    # Spawns tesseract twice; the answer doesn't change for the life of the server
+    return _tesseract_info()
+
 with st.sidebar:
     st.header("⚙️ Settings")
     # Processing mode
@@ -30,20 +57,51 @@ with st.sidebar:
     end_page = st.number_input("End page (0 = till end)", min_value=0, value=0)
 
     st.subheader("OCR")
+    tess = _ocr_probe()
+    if tess["available"]:
+        st.caption(f"Tesseract {tess['version']} · languages: {', '.join(tess['langs']) or 'none'}")
+    else:
+        st.caption("⚠️ Tesseract binary not found; OCR needs tesserocr")
     ocr_threshold = st.slider("OCR threshold (min chars before OCR)", min_value=0, max_value=500, value=40)
-    dpi = st.select_slider("OCR render DPI", options=[150, 200, 300, 400], value=300)
+    dpi = st.select_slider("OCR render DPI", options=[150, 200, 220, 300, 400], value=220,
+                           help="Higher DPI helps very small print; long page edges are capped at 3500 px")
+    ocr_retry_dpi = st.selectbox("Retry short OCR at DPI", options=[0, 300, 400], index=0,
+                                 format_func=lambda v: "Off" if v == 0 else str(v),
+                                 help="Re-OCR pages whose OCR text is still under the threshold at a higher DPI")
     ocr_lang = st.text_input("Tesseract languages", value="eng", help="e.g., eng or eng+deu")
-    ocr_psm = st.selectbox("PSM", options=["3", "4", "6", "11", "12", "13"], index=0)
+    ocr_psm = st.selectbox("PSM", options=["3", "4", "6", "11", "12", "13"], index=2,
+                           help="6 treats the page as one uniform text block and skips layout analysis; use 3 for multi-column layouts")
     ocr_oem = st.selectbox("OEM", options=["3", "1", "0", "2"], index=0)
+    ocr_engine = st.selectbox("OCR engine", options=["tesserocr (fast)", "pytesseract"], index=0,
+                              help="tesserocr reuses one in-process Tesseract for all pages; falls back to pytesseract if not installed")
+    use_tesserocr = ocr_engine.startswith("tesserocr")
+    use_batch_ocr = st.checkbox("Batch OCR (faster for many pages)", value=True,
+                                help="pytesseract engine: OCR pages in batches with one tesseract run each")
+    use_raster_cache = st.checkbox("Cache rendered pages", value=False,
+                                   help="Keep OCR page rasters so re-runs of the same PDF with other OCR settings skip rendering")
 
     st.subheader("Tables")
-    tbl_order = st.multiselect("Table engines (order of preference)", ["camelot", "tabula"], default=["camelot", "tabula"])
+    tbl_order = st.multiselect("Table engines (order of preference)", ["pymupdf", "camelot", "tabula"],
+                               default=["pymupdf", "camelot", "tabula"],
+                               help="pymupdf runs in-process; camelot and tabula are tried on pages it finds nothing on")
 
     st.subheader("Preview")
-    preview_pages = st.slider("Preview first N pages (for UI)", min_value=0, max_value=50, value=10)
+    preview_pages = st.slider("Preview first N pages (for UI)", min_value=0, max_value=PREVIEW_MAX_PAGES, value=10)
+
+    st.subheader("Performance")
+    cpu_count = os.cpu_count() or 1
+    num_workers = st.number_input("Worker processes", min_value=1, max_value=cpu_count, value=min(4, cpu_count),
+                                  help="Split the page range into shards processed in parallel")
+    ocr_workers = st.number_input("OCR workers", min_value=1, max_value=cpu_count,
+                                  value=1 if num_workers > 1 else max(1, cpu_count // 2),
+                                  disabled=num_workers > 1,
+                                  help="Parallel page rendering and single-threaded tesseract runs for OCR pages (without tesserocr); "
+                                       "with several worker processes each runs OCR on its own")
+    pretty_xml = st.checkbox("Pretty-print XML output", value=False,
+                             help="Indented XML is easier to read but larger and slower to write")
 
     st.markdown("---")
-    outdir = st.text_input("Output directory", value=str(Path.cwd() / "output"))
+    outdir = st.text_input("Output directory", value=DEFAULT_OUTDIR)
     
     st.subheader("💾 Storage")
     
@@ -67,126 +125,380 @@ with st.sidebar:
     run_btn = st.button("🚀 Run Extraction")
 
 # input section
-pdf_bytes = None
-pdf_name = None
+uploaded_pdf = None
 server_path = None
 
 st.markdown("### 📥 Input")
 if mode.startswith("Server"):
     server_path = st.text_input("Absolute path to PDF on server (e.g., /data/inbox/huge.pdf or C:\\data\\huge.pdf)")
 else:
-    up = st.file_uploader("Upload a PDF (prefer small/medium files here)", type=["pdf"])
-    if up:
-        pdf_bytes = up.read()
-        pdf_name = up.name
-
-# progress placeholders
-prog_bar = st.progress(0)
-status_text = st.empty()
-
-def _progress_cb(done, total):
-    if total <= 0:
-        frac = 0.0
-    else:
-        frac = min(max(done / total, 0), 1)
-    prog_bar.progress(frac)
-    status_text.info(f"Processing pages: {done}/{total}")
+    uploaded_pdf = st.file_uploader("Upload a PDF (prefer small/medium files here)", type=["pdf"])
 
-def _read_first_n_pages_from_xml(xml_path: Path, n: int):
+class _PreviewDone(Exception):
+    pass
+
+def _read_first_n_pages_from_xml(xml_path: Path, n: int, max_chars: int = 10000):
+    # SAX-style expat scan: no element objects, and parsing stops after n pages
     pages = []
+    if n <= 0:
+        return pages
+    cur = {"index": "?", "chunks": [], "length": 0}
+    in_text = False
+
+    def start(name, attrs):
+        nonlocal in_text
+        if name == "page":
+            cur.update(index=attrs.get("index", "?"), chunks=[], length=0)
+        elif name == "text":
+            in_text = True
+
+    def end(name):
+        nonlocal in_text
+        if name == "text":
+            in_text = False
+        elif name == "page":
+            text = "".join(cur["chunks"])
+            pages.append({
+                "index": cur["index"],
+                "text": text[:max_chars],
+                "truncated": len(text) > max_chars,
+            })
+            if len(pages) >= n:
+                raise _PreviewDone
+
+    def chars(data):
+        # Keep one char past the cap so truncation is still detected
+        if in_text and cur["length"] <= max_chars:
+            cur["chunks"].append(data)
+            cur["length"] += len(data)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = chars
     try:
-        tree = ET.parse(str(xml_path))
-        root = tree.getroot()
-        content = root.find("content")
-        if content is None:
-            return pages
-        for page in content.findall("page")[:n]:
-            idx = page.attrib.get("index", "?")
-            text_el = page.find("text")
-            text = text_el.text if text_el is not None else ""
-            pages.append({"index": idx, "text": text or ""})
-    except Exception as e:
+        with open(xml_path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 16)
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+    except _PreviewDone:
+        pass
+    except (xml.parsers.expat.ExpatError, OSError) as e:
         st.warning(f"Failed to parse XML preview: {e}")
     return pages
 
-# Initialize session state
-if 'processing_complete' not in st.session_state:
-    st.session_state.processing_complete = False
-if 'manifest' not in st.session_state:
-    st.session_state.manifest = None
-if 'xml_content' not in st.session_state:
-    st.session_state.xml_content = None
+@st.cache_data(show_spinner=False, max_entries=8)
+def _preview_pages(path_str: str, mtime: float, size: int, n: int):
+    # mtime/size are part of the cache key so a regenerated combined.xml is re-read
+    return _read_first_n_pages_from_xml(Path(path_str), n)
+
+def _top_k_files(directory: Path, suffix: str, k: int = 20):
+    """Return (first k matching paths by name, total match count) from one scandir pass.
+
+    suffix may be a tuple of suffixes, as with str.endswith.
+    """
+    total = 0
+    def _matches(it):
+        nonlocal total
+        for entry in it:
+            if entry.name.endswith(suffix) and entry.is_file():
+                total += 1
+                yield entry.name
+    try:
+        with os.scandir(directory) as it:
+            names = heapq.nsmallest(k, _matches(it))
+    except OSError:
+        return [], 0
+    return [directory / name for name in names], total
 
-# Run
-if run_btn:
-    # ensure outdir exists
-    Path(outdir).mkdir(parents=True, exist_ok=True)
+def _cached_top_k_files(directory: Path, suffix: str, k: int = 20, with_sizes: bool = False):
+    """_top_k_files memoized in session_state until the directory's mtime changes.
 
-    # Handle input file (temporary for uploads, direct for server paths)
-    temp_file_handle = None
+    with_sizes=True also returns the listed files' sizes, stat'ed once per listing.
+    """
     try:
-        if pdf_bytes and pdf_name:
-            # Create temporary file that will be automatically cleaned up
-            temp_file_handle = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-            temp_file_handle.write(pdf_bytes)
-            temp_file_handle.close()
-            input_path = temp_file_handle.name
-            st.info(f"📤 Processing uploaded file: {pdf_name}")
-        elif server_path:
-            input_path = server_path
-        else:
-            st.error("Please provide a server file path or upload a PDF.")
-            st.stop()
-
-        if not os.path.exists(input_path):
-            st.error(f"File not found: {input_path}")
-            st.stop()
+        mtime_ns = directory.stat().st_mtime_ns
+    except OSError:
+        return ([], 0, []) if with_sizes else ([], 0)
+    listings = st.session_state.setdefault("dir_listings", {})
+    key = (str(directory), suffix, k)
+    cached = listings.get(key)
+    if cached is None or cached[0] != mtime_ns:
+        cached = [mtime_ns, *_top_k_files(directory, suffix, k), None]
+        listings[key] = cached
+    if not with_sizes:
+        return cached[1], cached[2]
+    if cached[3] is None:
+        sizes = []
+        for p in cached[1]:
+            try:
+                sizes.append(p.stat().st_size)
+            except OSError:
+                sizes.append(None)
+        cached[3] = sizes
+    return cached[1], cached[2], cached[3]
+
+@st.cache_data(show_spinner=False, ttl=5)
+def _session_size_mb(path_str: str) -> float:
+    # Short TTL: the panel is redrawn on every rerun but sizes only change on cleanup
+    return _get_directory_size_mb(Path(path_str))
+
+# Streamlit 1.52+ accepts a callable as download data and only reads the file on click
+DEFERRED_DOWNLOADS = tuple(int(v) for v in re.findall(r"\d+", st.__version__)[:2]) >= (1, 52)
+
+
+def _download_data(read):
+    return read if DEFERRED_DOWNLOADS else read()
+
+
+def _zip_dir_bytes(directory: Path, suffix: str) -> bytes:
+    # Fast deflate: the XML compresses well even at level 1 and the zip is built on click
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        with os.scandir(directory) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if entry.name.endswith(suffix) and entry.is_file():
+                    zf.write(entry.path, arcname=entry.name)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _thumb(src: str, max_px: int = 256) -> bytes:
+    # Ship small WEBP thumbnails to the browser instead of full-resolution PNGs
+    from PIL import Image  # local import
+    with Image.open(src) as img:
+        img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=75)
+    return buf.getvalue()
+
+
+def _thumb_or_path(p: Path):
+    # A single undecodable image must not take down the whole gallery
+    try:
+        return _thumb(str(p))
+    except Exception:
+        return str(p)
+
+def _read_xml_window(xml_path: Path, max_bytes=None):
+    """Return (text, truncated) for the first max_bytes of the file (or all of it)."""
+    with open(xml_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return "", False
+        # Map instead of read: only the pages backing the window are touched
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            window = mm[:] if max_bytes is None else mm[:max_bytes]
+            truncated = max_bytes is not None and len(mm) > max_bytes
+    # errors="ignore" drops a multi-byte character split by the cut
+    return window.decode("utf-8", errors="ignore"), truncated
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _pretty_xml(path_str: str, mtime: float, max_chars=None) -> str:
+    """Pretty-print the first max_chars characters (or all) of the XML file, once per file version."""
+    with open(path_str, "r", encoding="utf-8") as f:
+        head = f.read() if max_chars is None else f.read(max_chars)
+    # recover=True closes the tags a truncated preview cuts off
+    parser = etree.XMLParser(recover=True, remove_blank_text=True, strip_cdata=False)
+    root = etree.fromstring(head.encode("utf-8"), parser)
+    if root is None:
+        raise ValueError("no parsable XML content")
+    return etree.tostring(root, pretty_print=True, encoding="unicode")
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        # One linear pass: let the kernel read ahead aggressively on this descriptor
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=32)
+def _cache_key(path: str, mtime: float, size: int, params: dict) -> str:
+    # mtime/size only key the memo, so an unchanged file is not re-hashed on every run;
+    # persisted to disk so this also holds across sessions and app restarts
+    params_digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{_file_sha256(path)}-{params_digest}"
+
+def _load_cached_manifest(outdir: str, key: str):
+    cache_dir = Path(outdir) / ".cache" / key
+    manifest_path = cache_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    # A session removed by cleanup (or deleted from the UI) is a miss: rerun rather than
+    # serve counts whose images and tables are gone
+    if not all(Path(manifest[k]).exists() for k in ("session_dir", "xml", "images_dir", "tables_dir")):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return None
+    manifest.pop("cleanup_stats", None)  # from the original run; nothing was cleaned up this time
+    return manifest
+
+def _store_cached_manifest(outdir: str, key: str, manifest: dict):
+    cache_dir = Path(outdir) / ".cache" / key
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / "manifest.json").write_text(_manifest_json(manifest), encoding="utf-8")
+
+def _run_extraction(job: dict, input_path: str, temp_path, outdir: str, params: dict, num_workers: int,
+                    auto_cleanup: bool, max_sessions: int, max_age_hours: float) -> dict:
+    """
+    Cache lookup + extraction, run on a background thread. Must not call st.*:
+    progress and messages go through the job dict, rendered by the script thread.
+    """
+    def progress_cb(done, total):
+        job["progress"] = (done, total)
 
-        st.info("Starting extraction… (this may take a while for large PDFs)")
-        prog_bar.progress(0)
+    try:
+        # Skip the whole pipeline when this exact PDF + settings was already processed
+        file_stat = os.stat(input_path)
+        cache_key = _cache_key(input_path, file_stat.st_mtime, file_stat.st_size, params)
+        manifest = _load_cached_manifest(outdir, cache_key)
+        if manifest is not None:
+            job["messages"].append(("info", f"♻️ Same PDF and settings as a previous run - reusing session `{manifest['session_id']}`"))
+            _safe_write_text(Path(outdir) / "manifest.json", _manifest_json(manifest, pretty=params.get("pretty", False)))
+            return manifest
 
         manifest = process_pdf(
             input_pdf=input_path,
             outdir=outdir,
-            start_page=int(start_page),
-            end_page=int(end_page),
-            ocr_threshold=int(ocr_threshold),
-            dpi=int(dpi),
-            ocr_lang=ocr_lang.strip(),
-            ocr_psm=str(ocr_psm),
-            ocr_oem=str(ocr_oem),
-            table_order=tbl_order if tbl_order else ["camelot", "tabula"],
-            progress_cb=_progress_cb,
+            progress_cb=progress_cb,
+            num_workers=num_workers,
             auto_cleanup=auto_cleanup,
             max_sessions=max_sessions,
             max_age_hours=max_age_hours,
+            **params,
         )
-    
+        try:
+            _store_cached_manifest(outdir, cache_key, manifest)
+        except Exception as e:
+            job["messages"].append(("warning", f"Could not cache results: {e}"))
+        return manifest
+
     finally:
         # Clean up temporary file if it was created
-        if temp_file_handle and os.path.exists(temp_file_handle.name):
+        if temp_path and os.path.exists(temp_path):
             try:
-                os.unlink(temp_file_handle.name)
-                st.success("🧹 Temporary upload file cleaned up")
+                os.unlink(temp_path)
+                job["messages"].append(("success", "🧹 Temporary upload file cleaned up"))
             except Exception as e:
-                st.warning(f"Could not clean up temporary file: {e}")
+                job["messages"].append(("warning", f"Could not clean up temporary file: {e}"))
+
+# Initialize session state
+if 'processing_complete' not in st.session_state:
+    st.session_state.processing_complete = False
+if 'manifest' not in st.session_state:
+    st.session_state.manifest = None
+if 'paths' not in st.session_state:
+    st.session_state.paths = None
+
+# Extractions run on one background worker per browser session
+if 'executor' not in st.session_state:
+    st.session_state.executor = ThreadPoolExecutor(max_workers=1)
+
+# Run
+if run_btn:
+    # ensure outdir exists
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+
+    # Handle input file (temporary for uploads, direct for server paths)
+    temp_path = None
+    if uploaded_pdf is not None:
+        # Temporary file is removed by the worker once extraction finishes
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file_handle:
+            # Copy in 1 MiB chunks instead of holding a second full copy of the upload in memory
+            uploaded_pdf.seek(0)
+            shutil.copyfileobj(uploaded_pdf, temp_file_handle, length=1 << 20)
+        input_path = temp_path = temp_file_handle.name
+        st.info(f"📤 Processing uploaded file: {uploaded_pdf.name}")
+    elif server_path:
+        input_path = server_path
+    else:
+        st.error("Please provide a server file path or upload a PDF.")
+        st.stop()
+
+    if not os.path.exists(input_path):
+        st.error(f"File not found: {input_path}")
+        st.stop()
+
+    params = {
+        "start_page": int(start_page),
+        "end_page": int(end_page),
+        "ocr_threshold": int(ocr_threshold),
+        "dpi": int(dpi),
+        "ocr_retry_dpi": int(ocr_retry_dpi),
+        "ocr_lang": ocr_lang.strip(),
+        "ocr_psm": str(ocr_psm),
+        "ocr_oem": str(ocr_oem),
+        "table_order": tbl_order if tbl_order else ["pymupdf", "camelot", "tabula"],
+        "use_tesserocr": bool(use_tesserocr),
+        "batch_ocr": bool(use_batch_ocr),
+        "ocr_workers": int(ocr_workers),
+        "pretty": bool(pretty_xml),
+        "raster_cache": bool(use_raster_cache),
+    }
+
+    job = {"progress": (0, 0), "messages": []}
+    job["future"] = st.session_state.executor.submit(
+        _run_extraction, job, input_path, temp_path, outdir, params,
+        int(num_workers), auto_cleanup, max_sessions, max_age_hours,
+    )
+    st.session_state.job = job
+
+# Poll the running extraction; a rerun (any widget change) re-attaches to the same job
+job = st.session_state.get("job")
+if job is not None:
+    with st.status("Extracting… (this may take a while for large PDFs)", expanded=True) as status:
+        prog_bar = st.progress(0)
+        status_text = st.empty()
+        while True:
+            done, total = job["progress"]
+            if total > 0:
+                prog_bar.progress(min(max(done / total, 0), 1))
+                status_text.info(f"Processing pages: {done}/{total}")
+            if job["future"].done():
+                break
+            time.sleep(0.2)
 
-    prog_bar.progress(1.0)
-    status_text.success("Done!")
-    
-    # Store results in session state
-    st.session_state.processing_complete = True
-    st.session_state.manifest = manifest
-    
-    # Load and store XML content
-    xml_path = Path(manifest["xml"])
-    if xml_path.exists():
         try:
-            with open(xml_path, "r", encoding="utf-8") as f:
-                st.session_state.xml_content = f.read()
+            manifest = job["future"].result()
         except Exception as e:
-            st.warning(f"Could not load XML content: {e}")
-            st.session_state.xml_content = None
+            manifest = None
+            error = e
+        if manifest is not None:
+            # Store results in session state before anything else can rerun or fail
+            st.session_state.processing_complete = True
+            st.session_state.manifest = manifest
+            # Resolved once here instead of on every rerun of the results below
+            st.session_state.paths = SimpleNamespace(
+                xml=Path(manifest["xml"]),
+                tables=Path(manifest["tables_dir"]),
+                images=Path(manifest["images_dir"]),
+                session=Path(manifest["session_dir"]),
+                manifest_json=Path(outdir) / "manifest.json",
+            )
+            try:
+                st.session_state.xml_size = st.session_state.paths.xml.stat().st_size
+            except OSError:
+                st.session_state.xml_size = 0
+            prog_bar.progress(1.0)
+            status.update(label="Done!", state="complete", expanded=False)
+        else:
+            status.update(label="Extraction failed", state="error")
+            st.error(f"Extraction failed: {error}")
+
+    for level, message in job["messages"]:
+        getattr(st, level)(message)
+    # Only now that the outcome is stored and shown is the job handle dropped
+    st.session_state.job = None
 
 # Clear session state button
 if st.session_state.processing_complete:
@@ -195,12 +507,13 @@ if st.session_state.processing_complete:
         if st.button("🔄 Process New PDF", help="Clear current results and start fresh"):
             st.session_state.processing_complete = False
             st.session_state.manifest = None
-            st.session_state.xml_content = None
+            st.session_state.paths = None
             st.rerun()
 
 # Display results if processing is complete
-if st.session_state.processing_complete and st.session_state.manifest:
+if st.session_state.processing_complete and st.session_state.manifest and st.session_state.paths:
     manifest = st.session_state.manifest
+    paths = st.session_state.paths
     
     # Summary metrics
     st.success(f"✅ Extraction complete - Session ID: {manifest['session_id']}")
@@ -212,9 +525,9 @@ if st.session_state.processing_complete and st.session_state.manifest:
     col3.metric("Images extracted", manifest["images_extracted"])
     col4.metric("Tables extracted", manifest["tables_extracted"])
 
-    xml_path = Path(manifest["xml"])
-    tables_dir = Path(manifest["tables_dir"])
-    images_dir = Path(manifest["images_dir"])
+    xml_path = paths.xml
+    tables_dir = paths.tables
+    images_dir = paths.images
 
     tabs = st.tabs(["Overview", "Preview Pages", "XML Output", "Downloads", "Images", "Tables", "Manifest"])
     with tabs[0]:
@@ -229,29 +542,36 @@ if st.session_state.processing_complete and st.session_state.manifest:
             "ocr_available": manifest["ocr_available"],
             "camelot_available": manifest["camelot_available"],
             "tabula_available": manifest["tabula_available"],
+            "pymupdf_tables_available": manifest.get("pymupdf_tables_available", False),
+            "tesserocr_available": manifest.get("tesserocr_available", False),
             "params": manifest["params"],
         })
 
     with tabs[1]:
         st.subheader(f"Preview (first {preview_pages} pages)")
         if preview_pages > 0:
-            pages = _read_first_n_pages_from_xml(xml_path, preview_pages)
+            pages = []
+            if xml_path.exists():
+                # Parse up to the slider maximum once per XML version; moving the slider only slices
+                xml_stat = xml_path.stat()
+                preview_key = (str(xml_path), xml_stat.st_mtime_ns)
+                if st.session_state.get("preview_key") != preview_key:
+                    st.session_state.preview_pages_data = _preview_pages(str(xml_path), xml_stat.st_mtime, xml_stat.st_size, PREVIEW_MAX_PAGES)
+                    st.session_state.preview_key = preview_key
+                pages = st.session_state.preview_pages_data[:int(preview_pages)]
             for p in pages:
                 with st.expander(f"📄 Page {p['index']}"):
-                  st.text_area("Text", value=(p["text"][:10000] + ("..." if len(p["text"]) > 10000 else "")), height=240, key=f"text_{p['index']}")
+                  st.text_area("Text", value=(p["text"] + ("..." if p["truncated"] else "")), height=240, key=f"text_{p['index']}")
         else:
             st.info("Set preview_pages > 0 in the sidebar to see a quick preview.")
 
     with tabs[2]:
         st.subheader("📄 Combined XML Output")
         
-        if xml_path.exists() and st.session_state.xml_content:
+        if xml_path.exists():
             try:
-                # Use XML content from session state
-                xml_content = st.session_state.xml_content
-                
                 # Display XML file info
-                file_size = xml_path.stat().st_size
+                file_size = st.session_state.get("xml_size") or xml_path.stat().st_size
                 if file_size < 1024:
                     size_str = f"{file_size} bytes"
                 elif file_size < 1024*1024:
@@ -266,7 +586,7 @@ if st.session_state.processing_complete and st.session_state.manifest:
                 with col1:
                     show_full = st.checkbox("Show full XML content", value=False, help="Warning: Large files may slow down the browser")
                 with col2:
-                    st.download_button("📥 Download XML", xml_content.encode(), file_name="combined.xml", mime="application/xml")
+                    st.download_button("📥 Download XML", _download_data(xml_path.read_bytes), file_name="combined.xml", mime="application/xml")
                 
                 # Display options
                 display_mode = st.radio(
@@ -276,42 +596,28 @@ if st.session_state.processing_complete and st.session_state.manifest:
                 )
                 
                 # Determine content to display
+                max_chars = 50000
+                truncated = False
                 if show_full:
-                    display_content = xml_content
+                    display_content, _ = _read_xml_window(xml_path)
                     st.warning(f"⚠️ Showing full content ({size_str}). This may take time to load for large files.")
                 else:
                     # Show first 50KB for preview
-                    max_chars = 50000
-                    if len(xml_content) > max_chars:
-                        display_content = xml_content[:max_chars]
-                        truncated = True
-                    else:
-                        display_content = xml_content
-                        truncated = False
+                    display_content, truncated = _read_xml_window(xml_path, max_chars)
                 
                 if display_mode == "🔍 Search & Highlight":
                     # Search functionality
                     search_term = st.text_input("🔍 Search in XML:", placeholder="Enter text to search...", key="xml_search")
                     
                     if search_term and search_term.strip():
-                        # Count occurrences (case insensitive)
-                        search_lower = search_term.lower().strip()
-                        content_lower = display_content.lower()
-                        count = content_lower.count(search_lower)
+                        # Case-insensitive match; substitute with a backreference so every match
+                        # stays in the C regex engine, and count in the same pass
+                        pattern = re.compile(re.escape(search_term.strip()), re.IGNORECASE)
+                        highlighted_content, count = pattern.subn(r"**\g<0>**", display_content)
                         
                         if count > 0:
                             st.success(f"Found {count} occurrence(s) of '{search_term}'")
                             
-                            # Case insensitive highlighting
-                            import re
-                            # Use regex for case-insensitive replacement
-                            highlighted_content = re.sub(
-                                re.escape(search_term), 
-                                lambda m: f"**{m.group()}**",
-                                display_content, 
-                                flags=re.IGNORECASE
-                            )
-                            
                             st.text_area(
                                 "XML Content (with highlights):",
                                 value=highlighted_content,
@@ -348,16 +654,9 @@ if st.session_state.processing_complete and st.session_state.manifest:
                 else:  # Formatted XML
                     # Try to format XML nicely
                     try:
-                        import xml.dom.minidom as minidom
-                        # Parse and pretty print (only for smaller content)
+                        # Parse and pretty print (only for smaller content), cached per file version
                         if len(display_content) < 100000:  # Only format smaller files
-                            dom = minidom.parseString(display_content)
-                            pretty_xml = dom.toprettyxml(indent="  ")
-                            # Remove empty lines and XML declaration
-                            lines = pretty_xml.split('\n')
-                            # Skip the XML declaration line and empty lines
-                            filtered_lines = [line for line in lines[1:] if line.strip()]
-                            pretty_xml = '\n'.join(filtered_lines)
+                            pretty_xml = _pretty_xml(str(xml_path), xml_path.stat().st_mtime, None if show_full else max_chars)
                             st.code(pretty_xml, language="xml")
                         else:
                             st.info("File too large for formatting. Showing as plain text.")
@@ -378,7 +677,7 @@ if st.session_state.processing_complete and st.session_state.manifest:
                 
                 # Show truncation notice
                 if not show_full and truncated:
-                    st.info(f"📄 Showing first {max_chars:,} characters. Enable 'Show full XML content' to see everything.")
+                    st.info(f"📄 Showing first {max_chars:,} bytes. Enable 'Show full XML content' to see everything.")
                     
             except Exception as e:
                 st.error(f"Failed to read XML file: {e}")
@@ -388,40 +687,43 @@ if st.session_state.processing_complete and st.session_state.manifest:
 
     with tabs[3]:
         st.subheader("Downloads")
+        # Deferred callables: files are read only when a download is actually clicked
         if xml_path.exists():
-            with open(xml_path, "rb") as f:
-                xml_data = f.read()
-            st.download_button("📥 Download combined.xml", xml_data, file_name="combined.xml", mime="application/xml")
-        manifest_path = Path(outdir) / "manifest.json"
+            st.download_button("📥 Download combined.xml", _download_data(xml_path.read_bytes), file_name="combined.xml", mime="application/xml")
+        manifest_path = paths.manifest_json
         if manifest_path.exists():
-            with open(manifest_path, "rb") as f:
-                manifest_data = f.read()
-            st.download_button("📥 Download manifest.json", manifest_data, file_name="manifest.json", mime="application/json")
+            st.download_button("📥 Download manifest.json", _download_data(manifest_path.read_bytes), file_name="manifest.json", mime="application/json")
 
     with tabs[4]:
         st.subheader("Extracted Images (first 20)")
-        imgs = sorted(images_dir.glob("*.png"))[:20]
+        imgs, total_imgs = _cached_top_k_files(images_dir, IMAGE_SUFFIXES)
         if imgs:
-            st.caption(f"Showing {len(imgs)} of {len(list(images_dir.glob('*.png')))} images.")
-            st.image([str(p) for p in imgs], use_container_width=True)
+            st.caption(f"Showing {len(imgs)} of {total_imgs} images.")
+            st.image([_thumb_or_path(p) for p in imgs], caption=[p.name for p in imgs])
         else:
             st.info("No embedded images found (or engine skipped).")
 
     with tabs[5]:
         st.subheader("Table Files (first 20)")
-        tpaths = sorted(tables_dir.glob("*.xml"))[:20]
+        tpaths, total_tpaths, tsizes = _cached_top_k_files(tables_dir, ".xml", with_sizes=True)
         if tpaths:
-            st.caption(f"Showing {len(tpaths)} of {len(list(tables_dir.glob('*.xml')))} table files.")
+            st.caption(f"Showing {len(tpaths)} of {total_tpaths} table files.")
             st.info(f"🔒 **Session Isolation**: Tables stored in isolated session `{manifest['session_id']}` directory")
             
+            st.download_button(
+                f"📥 Download all {total_tpaths} tables (ZIP)",
+                data=_download_data(lambda: _zip_dir_bytes(tables_dir, ".xml")),
+                file_name=f"tables_{manifest['session_id']}.zip",
+                mime="application/zip",
+            )
+            
             # Create columns for better layout
-            col1, col2, col3 = st.columns([2, 1, 1])
+            col1, col2 = st.columns([2, 1])
             col1.write("**File Name**")
             col2.write("**Size**")
-            col3.write("**Download**")
             
-            for p in tpaths:
-                col1, col2, col3 = st.columns([2, 1, 1])
+            for p, size_bytes in zip(tpaths, tsizes):
+                col1, col2 = st.columns([2, 1])
                 
                 # Extract page and table info from filename
                 filename_parts = p.stem.split('_')
@@ -436,7 +738,6 @@ if st.session_state.processing_complete and st.session_state.manifest:
                 
                 # File size
                 try:
-                    size_bytes = p.stat().st_size
                     if size_bytes < 1024:
                         size_str = f"{size_bytes}B"
                     elif size_bytes < 1024*1024:
@@ -446,19 +747,6 @@ if st.session_state.processing_complete and st.session_state.manifest:
                     col2.write(size_str)
                 except:
                     col2.write("N/A")
-                
-                # Download button
-                with col3:
-                    with open(p, "rb") as f:
-                        file_data = f.read()
-                    st.download_button(
-                        label="📥",
-                        data=file_data,
-                        file_name=p.name,
-                        mime="application/xml",
-                        key=str(p),
-                        help=f"Download {p.name}"
-                    )
         else:
             st.info("No tables detected (or no table engine available).")
             st.write("💡 **Tips for better table detection:**")
@@ -468,12 +756,8 @@ if st.session_state.processing_complete and st.session_state.manifest:
 
     with tabs[6]:
         st.subheader("Manifest")
-        man_path = Path(outdir) / "manifest.json"
-        if man_path.exists():
-            import json
-            st.json(json.loads(man_path.read_text(encoding="utf-8")))
-        else:
-            st.info("manifest.json not found.")
+        # Same dict process_pdf wrote to manifest.json, already held in session_state
+        st.json(manifest)
     
     # Session cleanup information and manual controls
     if manual_cleanup:
@@ -481,11 +765,10 @@ if st.session_state.processing_complete and st.session_state.manifest:
         st.subheader("🧹 Session Management")
         
         # Show current session info
-        session_path = Path(manifest['session_dir'])
+        session_path = paths.session
         if session_path.exists():
             try:
-                from pdf_to_universal_xml import _get_directory_size_mb
-                session_size = _get_directory_size_mb(session_path)
+                session_size = _session_size_mb(str(session_path))
                 st.info(f"💾 Current session size: **{session_size:.1f} MB**")
             except:
                 st.info("💾 Current session is active")
@@ -19,45 +19,81 @@ CLI and callable function: process_pdf(...)
 """
 
 import os
-import io
-import sys
+import re
 import json
 import math
+import time
+import shutil
+import hashlib
 import argparse
+import importlib
+import functools
+import contextlib
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from typing import TYPE_CHECKING, Optional, List, Dict, Any
+from importlib.util import find_spec
+from queue import Empty
+from multiprocessing import Manager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 import fitz  # PyMuPDF
 from lxml import etree
 
-# OCR (optional)
-OCR_AVAILABLE = False
-try:
-    import pytesseract
+if TYPE_CHECKING:
     from PIL import Image
-    import numpy as np
-    import cv2
-    # Set Tesseract path to make OCR functionality work on Windows
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-    OCR_AVAILABLE = True
-except Exception:
-    OCR_AVAILABLE = False
 
-# Tables (optional)
-CAMELOT_AVAILABLE = False
-TABULA_AVAILABLE = False
-try:
-    import camelot
-    CAMELOT_AVAILABLE = True
-except Exception:
-    pass
+
+def _has_modules(*names: str) -> bool:
+    """True when every module is installed, checked without importing it."""
+    try:
+        return all(find_spec(name) is not None for name in names)
+    except Exception:
+        return False
+
+
+# Optional dependencies are only located here; cv2, camelot and tabula (JVM bridge)
+# are imported on first use so --help and text-only runs don't pay for them.
+
+# OCR (optional)
+OCR_AVAILABLE = _has_modules("pytesseract", "PIL", "numpy", "cv2")
+
+# In-process Tesseract API (optional, avoids spawning tesseract per page)
+TESSEROCR_AVAILABLE = _has_modules("tesserocr")
+
+# Fast raster cache compression (optional, PNG otherwise)
+ZSTD_AVAILABLE = False
 try:
-    import tabula
-    TABULA_AVAILABLE = True
+    import zstandard
+    ZSTD_AVAILABLE = True
 except Exception:
     pass
 
+# Tables (optional)
+CAMELOT_AVAILABLE = _has_modules("camelot")
+TABULA_AVAILABLE = _has_modules("tabula")
+PYMUPDF_TABLES_AVAILABLE = hasattr(fitz.Page, "find_tables")  # PyMuPDF >= 1.23, runs in-process
+
+
+OCR_BATCH_SIZE = 16  # OCR pages per deferred OCR window; bounds how many pages wait on the XML
+TABLE_BATCH_PAGES = 50  # pages per batched Camelot call
+OCR_DEFAULT_DPI = 220  # Tesseract accuracy levels off around 200 DPI for body text; raise for tiny fonts
+OCR_MAX_EDGE_PX = 3500  # OCR rasters are scaled down so the long edge stays within this
+OCR_MIN_TEXT_COVERAGE = 0.02  # low-text pages whose text blocks cover more of the page than this skip OCR
+OCR_CACHE_SIZE = 512  # OCR results kept per process, keyed by binarized image hash
+RASTER_CACHE_MAX_MB = 2048  # least recently used PDFs are dropped from the raster cache beyond this
+NATIVE_IMAGE_EXTS = ("png", "jpeg", "jpg")  # embedded image formats written without re-encoding
+
+# Repeated pages (forms, boilerplate, blank scans) binarize to identical images
+_OCR_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+# Control characters XML can't carry (everything below 0x20 except tab, newline, carriage return)
+_XML_INVALID_CHARS = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")
+# Same set as a translate table; str.translate has an ASCII fast path but is slow on other text
+_XML_INVALID_TRANS = dict.fromkeys([c for c in range(0x20) if c not in (0x09, 0x0A, 0x0D)])
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -65,8 +101,15 @@ def _now_iso() -> str:
 
 def _safe_write_bytes(path: Path, data: bytes):
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(data)
+    # Single-shot write straight to the fd; the buffered file object buys nothing here
+    # O_BINARY (Windows only) keeps os.write from translating newlines
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
 
 def _safe_write_text(path: Path, data: str, encoding="utf-8"):
@@ -75,57 +118,412 @@ def _safe_write_text(path: Path, data: str, encoding="utf-8"):
         f.write(data)
 
 
-def _page_to_image(page, dpi: int = 300) -> "Image.Image":
-    zoom = dpi / 72.0
+def _manifest_json(manifest: Dict[str, Any], pretty: bool = False) -> str:
+    """manifest.json text: compact for machines, indented when pretty output was asked for."""
+    if pretty:
+        return json.dumps(manifest, indent=2, ensure_ascii=False)
+    return json.dumps(manifest, separators=(",", ":"), ensure_ascii=False)
+
+
+def _page_to_image(page, dpi: int = OCR_DEFAULT_DPI) -> "Image.Image":
+    """Rasterize a page for OCR as an 8-bit grayscale PIL image."""
+    # Oversized pages (posters, drawings) would otherwise explode the pixel count
+    zoom = min(dpi / 72.0, OCR_MAX_EDGE_PX / max(page.rect.width, page.rect.height, 1))
     mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
+    # OCR only ever sees luminance: render gray, a third of the bytes of RGB
+    pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY)
+    from PIL import Image  # local import
+    # Wrap the pixmap's samples directly rather than round-tripping through PNG
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+def _pdf_fingerprint(path: str) -> str:
+    """Content key for a PDF: blake2b over the whole file, so the key changes whenever any byte does."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(functools.partial(f.read, 1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _trim_raster_cache(cache_root: Path, keep: Path, max_mb: float = RASTER_CACHE_MAX_MB) -> None:
+    """Drop the least recently used per-PDF raster caches (never keep) until the rest fit in max_mb."""
+    with os.scandir(cache_root) as it:
+        entries = sorted((entry.stat().st_mtime, Path(entry.path)) for entry in it if entry.is_dir())
+    sizes = {path: _get_directory_size_mb(path) for _, path in entries}
+    total = sum(sizes.values())
+    for _, path in entries:  # oldest first
+        if total <= max_mb:
+            break
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[path]
+
+
+def _save_raster(img: "Image.Image", path: Path):
+    """Write a cache raster: zstd-framed raw pixels when available, fast PNG otherwise."""
+    if path.suffix == ".zst":
+        header = f"{img.width} {img.height} {img.mode}\n".encode("ascii")
+        cctx = zstandard.ZstdCompressor(level=1, threads=-1)
+        path.write_bytes(cctx.compress(header + img.tobytes()))
+    else:
+        img.save(path, format="PNG", optimize=False, compress_level=1)
+
+
+def _load_raster(path: Path) -> "Image.Image":
     from PIL import Image  # local import
-    return Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
+    if path.suffix == ".zst":
+        buf = zstandard.ZstdDecompressor().decompress(path.read_bytes())
+        header, raw = buf.split(b"\n", 1)
+        w, h, mode = header.decode("ascii").split()
+        return Image.frombytes(mode, (int(w), int(h)), raw)
+    with Image.open(path) as im:
+        im.load()
+        return im
 
 
-def _ocr_image(pil_img: "Image.Image", lang: str = "eng", psm: str = "3", oem: str = "3", timeout: int = 120) -> str:
+def _needs_ocr(page) -> bool:
+    """
+    For a page with little extractable text, decide from its block layout whether
+    rendering + OCR can add anything. Text that covers a real share of the page
+    (large headings, sparse forms) is already all there is, unless images cover
+    even more of it, as on a scan with a typed header. A page with no text,
+    images or vector paths is blank and never needs OCR.
+    """
+    try:
+        blocks = page.get_text("blocks")
+        images = page.get_image_info()  # placements only, nothing is decoded
+        if not blocks and not images and not page.get_cdrawings():
+            return False
+    except Exception:
+        return True
+    page_rect = page.rect
+    page_area = max(page_rect.width * page_rect.height, 1.0)
+    text_area = sum(fitz.Rect(b[:4]).get_area() for b in blocks if b[6] == 0)
+    image_area = sum((fitz.Rect(im["bbox"]) & page_rect).get_area() for im in images)
+    return text_area / page_area < OCR_MIN_TEXT_COVERAGE or image_area > text_area
+
+
+def _cached_page_image(page, dpi: int = OCR_DEFAULT_DPI, cache_dir: Optional[Path] = None) -> "Image.Image":
+    """_page_to_image, reusing a raster saved by an earlier run at the same DPI."""
+    if cache_dir is None:
+        return _page_to_image(page, dpi=dpi)
+    cache_path = cache_dir / f"{page.number:06d}_{dpi}{'.zst' if ZSTD_AVAILABLE else '.png'}"
+    if cache_path.exists():
+        try:
+            return _load_raster(cache_path)
+        except Exception:
+            pass
+    img = _page_to_image(page, dpi=dpi)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Shards and render workers may race on the same page: write aside, then rename
+        tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp{cache_path.suffix}")
+        _save_raster(img, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        pass
+    return img
+
+
+@functools.lru_cache(maxsize=1)
+def _get_pytesseract():
+    """Import pytesseract on first OCR use."""
+    import pytesseract
+    # Set Tesseract path to make OCR functionality work on Windows
+    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    return pytesseract
+
+
+@functools.lru_cache(maxsize=1)
+def _ocr_deps() -> bool:
+    """
+    Import the OCR stack once per process. An installed but broken module
+    (e.g. cv2 without libGL) turns OCR off instead of failing the first OCR page.
+    """
     if not OCR_AVAILABLE:
-        return ""
-    config = f"--psm {psm} --oem {oem}"
+        return False
+    try:
+        _get_pytesseract()
+        for name in ("PIL.Image", "numpy", "cv2"):
+            importlib.import_module(name)
+    except Exception:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=1)
+def _tesseract_info() -> Dict[str, Any]:
+    """Probe the tesseract binary once per process: availability, version and installed languages."""
+    if not _ocr_deps():
+        return {"available": False}
+    try:
+        return {
+            "available": True,
+            "version": str(_get_pytesseract().get_tesseract_version()),
+            "langs": _get_pytesseract().get_languages(config=""),
+        }
+    except Exception:
+        return {"available": False}
+
+
+def _open_tess_api(lang: str = "eng", psm: str = "6", oem: str = "3"):
+    """Create a reusable tesserocr API, or None to fall back to pytesseract."""
+    if not (TESSEROCR_AVAILABLE and _ocr_deps()):
+        return None
+    try:
+        import tesserocr  # local import
+        return tesserocr.PyTessBaseAPI(lang=lang, psm=int(psm), oem=int(oem))
+    except Exception:
+        return None
+
+
+def _binarize(pil_img: "Image.Image"):
+    """Grayscale + Otsu binarization as a uint8 array, thresholded in place."""
     import numpy as np  # local import
     import cv2
     img = np.array(pil_img)
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    from PIL import Image
-    pil_proc = Image.fromarray(th)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+    return gray
+
+
+def _preprocess_for_ocr(pil_img: "Image.Image") -> "Image.Image":
+    """Grayscale + Otsu binarization ahead of Tesseract."""
+    from PIL import Image  # local import
+    return Image.fromarray(_binarize(pil_img))
+
+
+def _ocr_cache_key(data, lang: str, psm: str, oem: str) -> str:
+    h = hashlib.blake2b(f"{lang}|{psm}|{oem}\0".encode(), digest_size=16)
+    h.update(data)
+    return h.hexdigest()
+
+
+def _ocr_cache_get(key: str) -> Optional[str]:
+    text = _OCR_CACHE.get(key)
+    if text is not None:
+        _OCR_CACHE.move_to_end(key)
+    return text
+
+
+def _ocr_cache_put(key: str, text: str):
+    # Empty output may be a timeout or tesseract failure; don't pin it
+    if not text.strip():
+        return
+    _OCR_CACHE[key] = text
+    _OCR_CACHE.move_to_end(key)
+    while len(_OCR_CACHE) > OCR_CACHE_SIZE:
+        _OCR_CACHE.popitem(last=False)
+
+
+def _ocr_image(pil_img: "Image.Image", lang: str = "eng", psm: str = "6", oem: str = "3", timeout: int = 120, api=None) -> str:
+    if not _ocr_deps():
+        return ""
+    th = _binarize(pil_img)
+    # Hash the array's buffer directly; tobytes() would copy the whole page
+    key = _ocr_cache_key(th.data, lang, psm, oem)
+    text = _ocr_cache_get(key)
+    if text is None:
+        from PIL import Image  # local import
+        pil_proc = Image.fromarray(th)
+        text = _ocr_image_uncached(pil_img, pil_proc, lang=lang, psm=psm, oem=oem, timeout=timeout, api=api)
+        _ocr_cache_put(key, text)
+    return text
+
+
+def _ocr_image_uncached(pil_img, pil_proc, lang: str, psm: str, oem: str, timeout: int, api) -> str:
+    config = f"--psm {psm} --oem {oem}"
+    if api is not None:
+        try:
+            api.SetImage(pil_proc)
+            return api.GetUTF8Text()
+        except Exception:
+            pass
     try:
-        return pytesseract.image_to_string(pil_proc, lang=lang, config=config, timeout=timeout)
+        return _get_pytesseract().image_to_string(pil_proc, lang=lang, config=config, timeout=timeout)
     except Exception:
         try:
-            return pytesseract.image_to_string(pil_img, lang=lang, config=config, timeout=timeout)
+            return _get_pytesseract().image_to_string(pil_img, lang=lang, config=config, timeout=timeout)
         except Exception:
             return ""
 
 
+def _ocr_image_file(path: Path, lang: str = "eng", psm: str = "6", oem: str = "3", timeout: int = 120) -> str:
+    try:
+        return _get_pytesseract().image_to_string(str(path), lang=lang, config=f"--psm {psm} --oem {oem}", timeout=timeout)
+    except Exception:
+        return ""
+
+
+def _ocr_images_batch(image_paths: List[Path], lang: str = "eng", psm: str = "6", oem: str = "3", timeout: int = 120) -> List[str]:
+    """
+    OCR several preprocessed page images with a single tesseract run.
+
+    Tesseract reads a .txt input as a list of images and separates the pages of
+    its output with form feeds, so startup and language loading happen once per
+    batch. Falls back to one call per image if the batched output doesn't split
+    cleanly.
+    """
+    config = f"--psm {psm} --oem {oem}"
+    list_path = image_paths[0].with_name(f"{image_paths[0].stem}_list.txt")
+    _safe_write_text(list_path, "".join(f"{p}\n" for p in image_paths))
+    try:
+        out = _get_pytesseract().image_to_string(str(list_path), lang=lang, config=config, timeout=timeout * len(image_paths))
+        texts = out.split("\x0c")
+        if len(texts) == len(image_paths) + 1 and not texts[-1].strip():
+            texts = texts[:-1]
+        if len(texts) == len(image_paths):
+            return texts
+    except Exception:
+        pass
+    return [_ocr_image_file(p, lang=lang, psm=psm, oem=oem, timeout=timeout) for p in image_paths]
+
+
+def _ocr_image_files(image_paths: List[Path], lang: str = "eng", psm: str = "6", oem: str = "3",
+                     batch: bool = False, workers: int = 1, pool: Optional[ProcessPoolExecutor] = None) -> List[str]:
+    """
+    OCR saved page images, optionally batched and spread over a pool of worker
+    processes started with _limit_omp_threads. Results come back in input order.
+    """
+    if not image_paths:
+        return []
+    # Serve repeated pages from the OCR cache and send each distinct image to tesseract once
+    keys = []
+    for p in image_paths:
+        try:
+            keys.append(_ocr_cache_key(Path(p).read_bytes(), lang, psm, oem))
+        except OSError:
+            keys.append(None)
+    texts = [_ocr_cache_get(k) if k is not None else None for k in keys]
+    todo = {}
+    for i, (p, k) in enumerate(zip(image_paths, keys)):
+        if texts[i] is None:
+            todo.setdefault(k if k is not None else ("path", i), p)
+    if todo:
+        fresh = dict(zip(todo, _ocr_image_files_uncached(list(todo.values()), lang=lang, psm=psm, oem=oem,
+                                                          batch=batch, workers=workers, pool=pool)))
+        for k, text in fresh.items():
+            if isinstance(k, str):
+                _ocr_cache_put(k, text)
+        for i, k in enumerate(keys):
+            if texts[i] is None:
+                texts[i] = fresh[k if k is not None else ("path", i)]
+    return texts
+
+
+def _ocr_image_files_uncached(image_paths: List[Path], lang: str, psm: str, oem: str,
+                              batch: bool, workers: int, pool: Optional[ProcessPoolExecutor]) -> List[str]:
+    workers = max(1, min(workers, len(image_paths)))
+    if batch:
+        size = math.ceil(len(image_paths) / workers)
+        chunks = [image_paths[i:i + size] for i in range(0, len(image_paths), size)]
+        run = functools.partial(_ocr_images_batch, lang=lang, psm=psm, oem=oem)
+    else:
+        chunks = image_paths
+        run = functools.partial(_ocr_image_file, lang=lang, psm=psm, oem=oem)
+    if workers == 1 or pool is None:
+        results = [run(c) for c in chunks]
+    else:
+        results = list(pool.map(run, chunks))
+    if not batch:
+        return results
+    return [text for chunk_texts in results for text in chunk_texts]
+
+
+def _limit_omp_threads() -> None:
+    """Worker initializer: one OpenMP thread per tesseract run, so the worker count provides the parallelism."""
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _render_ocr_images(pdf_path: str, jobs: List[tuple], dpi: int = OCR_DEFAULT_DPI, cache_dir: Optional[Path] = None) -> None:
+    """Render, binarize and save (page_index, png_path) jobs. Runs in a worker process with its own document."""
+    with fitz.open(pdf_path) as doc:
+        for idx, png_path in jobs:
+            _preprocess_for_ocr(_cached_page_image(doc[idx], dpi=dpi, cache_dir=cache_dir)).save(png_path)
+
+
 def _extract_embedded_images(doc, page, page_index: int, outdir: Path) -> List[Dict[str, Any]]:
     results = []
     for img_idx, info in enumerate(page.get_images(full=True)):
         xref = info[0]
         try:
-            pix = fitz.Pixmap(doc, xref)
-            if pix.n >= 5:  # has alpha or CMYK
-                pix = fitz.Pixmap(fitz.csRGB, pix)
-            img_bytes = pix.tobytes("png")
-            img_path = outdir / f"page_{page_index+1:06d}_img_{img_idx+1:03d}.png"
+            # Keep the embedded stream as-is when it's already a viewable format
+            img = doc.extract_image(xref)
+            if img and img.get("ext") in NATIVE_IMAGE_EXTS and img.get("colorspace") != 4:  # CMYK needs recolor
+                ext, img_bytes = img["ext"], img["image"]
+                width, height = img["width"], img["height"]
+            else:
+                pix = fitz.Pixmap(doc, xref)
+                if pix.colorspace and pix.colorspace.n >= 4:  # CMYK, with or without alpha
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                ext, img_bytes = "png", pix.tobytes("png")
+                width, height = pix.width, pix.height
+            img_path = outdir / f"page_{page_index+1:06d}_img_{img_idx+1:03d}.{ext}"
             _safe_write_bytes(img_path, img_bytes)
             results.append({
                 "index": img_idx + 1,
                 "path": str(img_path),
-                "width": pix.width,
-                "height": pix.height,
+                "width": width,
+                "height": height,
             })
         except Exception:
             continue
     return results
 
 
-def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: List[str], tables_dir: Path) -> List[Dict[str, Any]]:
+def _dataframe_table_xml(df, engine: str, pretty: bool = False) -> bytes:
+    """
+    Serialize a DataFrame as <table><tr><td>... XML in one pass over its values,
+    instead of an lxml element per cell. Missing values become empty cells.
+    """
+    import pandas as pd  # local import; only the table engines need pandas
+    values = df.to_numpy(dtype=object)
+    missing = pd.isna(values)  # one vectorized pass instead of a NaN check per cell
+    cells = [["" if miss else escape(str(v)) for v, miss in zip(row, row_missing)]
+             for row, row_missing in zip(values.tolist(), missing.tolist())]
+    return _cells_table_xml(cells, engine, pretty=pretty)
+
+
+def _rows_table_xml(rows: List[List[Any]], engine: str, pretty: bool = False) -> bytes:
+    """Serialize row lists (None for empty cells) in the same format as _dataframe_table_xml."""
+    cells = [["" if v is None else escape(str(v)) for v in row] for row in rows]
+    return _cells_table_xml(cells, engine, pretty=pretty)
+
+
+def _cells_table_xml(cells: List[List[str]], engine: str, pretty: bool = False) -> bytes:
+    head = f"<?xml version='1.0' encoding='utf-8'?>\n<table engine=\"{escape(engine)}\""
+    nl = "\n" if pretty else ""
+    if not cells:
+        return f"{head}/>{nl}".encode("utf-8")
+    if pretty:
+        rows = "".join("  <tr>\n" + "".join(f"    <td>{c}</td>\n" for c in row) + "  </tr>\n" if row else "  <tr/>\n"
+                       for row in cells)
+    else:
+        rows = "".join("<tr>" + "".join(f"<td>{c}</td>" for c in row) + "</tr>" if row else "<tr/>" for row in cells)
+    # Only cell text can hold control characters, so one pass over the document strips them all
+    return _XML_INVALID_CHARS.sub("", f"{head}>{nl}{rows}</table>{nl}").encode("utf-8")
+
+
+def _export_tables_pymupdf(doc, page_number_1based: int, tables_dir: Path, first_index: int = 1,
+                           pretty: bool = False) -> List[Dict[str, Any]]:
+    """Find tables with PyMuPDF's page.find_tables() and write them as table XML."""
+    out = []
+    for t in doc[page_number_1based - 1].find_tables().tables:
+        table_index = first_index + len(out)
+        xml_path = tables_dir / f"page_{page_number_1based:06d}_table_{table_index:03d}.xml"
+        _safe_write_bytes(xml_path, _rows_table_xml(t.extract(), engine="pymupdf", pretty=pretty))
+        out.append({
+            "engine": "pymupdf",
+            "path": str(xml_path),
+            "index": table_index,
+            "page": page_number_1based
+        })
+    return out
+
+
+def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: List[str], tables_dir: Path,
+                         pretty: bool = False) -> List[Dict[str, Any]]:
     found_tables = []
     global_table_index = 1  # Global counter for consistent table numbering
 
@@ -133,6 +531,7 @@ def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: Li
         nonlocal global_table_index
         out = []
         try:
+            import camelot  # local import; pulls in pdfminer and OpenCV
             tables = camelot.read_pdf(pdf_path, pages=str(page_number_1based), flavor=flavor, suppress_stdout=True)
             for i, t in enumerate(tables):
                 xml_path = tables_dir / f"page_{page_number_1based:06d}_table_{global_table_index:03d}.xml"
@@ -152,16 +551,11 @@ def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: Li
         nonlocal global_table_index
         out = []
         try:
+            import tabula  # local import; starts the JVM bridge
             dfs = tabula.read_pdf(pdf_path, pages=page_number_1based, multiple_tables=True, guess=True, lattice=False, stream=True)
             for i, df in enumerate(dfs or []):
-                root = etree.Element("table", engine="tabula")
-                for _, row in df.iterrows():
-                    row_el = etree.SubElement(root, "tr")
-                    for cell in row:
-                        cell_el = etree.SubElement(row_el, "td")
-                        cell_el.text = "" if (cell is None or (isinstance(cell, float) and math.isnan(cell))) else str(cell)
                 xml_path = tables_dir / f"page_{page_number_1based:06d}_table_{global_table_index:03d}.xml"
-                _safe_write_bytes(xml_path, etree.tostring(root, pretty_print=True, encoding="utf-8", xml_declaration=True))
+                _safe_write_bytes(xml_path, _dataframe_table_xml(df, engine="tabula", pretty=pretty))
                 out.append({
                     "engine": "tabula", 
                     "path": str(xml_path),
@@ -174,7 +568,17 @@ def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: Li
         return out
 
     for engine in table_order:
-        if engine == "camelot" and CAMELOT_AVAILABLE:
+        if engine == "pymupdf" and PYMUPDF_TABLES_AVAILABLE:
+            try:
+                with fitz.open(pdf_path) as doc:
+                    got = _export_tables_pymupdf(doc, page_number_1based, tables_dir, global_table_index, pretty=pretty)
+            except Exception:
+                got = []
+            global_table_index += len(got)
+            found_tables.extend(got)
+            if got:
+                break
+        elif engine == "camelot" and CAMELOT_AVAILABLE:
             got = export_tables_camelot("lattice") or export_tables_camelot("stream")
             found_tables.extend(got)
             if got:
@@ -188,9 +592,82 @@ def _extract_tables_page(pdf_path: str, page_number_1based: int, table_order: Li
     return found_tables
 
 
-def _build_xml_scaffold(input_pdf: str, total_pages: int, start_page: int, end_page: int) -> etree._ElementTree:
-    root = etree.Element("document")
-    meta = etree.SubElement(root, "metadata")
+def _extract_tables_range(pdf_path: str, first_page: int, last_page: int, table_order: List[str], tables_dir: Path,
+                          pretty: bool = False, pages: Optional[List[int]] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    _extract_tables_page for pages first_page..last_page (1-based), returned by page number.
+    With pages, only those pages of the range are tried; the rest come back empty.
+
+    Camelot reads the whole range in one call per flavor instead of reopening the PDF
+    for every page; each page still falls through lattice -> stream -> tabula on its own,
+    and files are named exactly as in the per-page path.
+    """
+    found = {p: [] for p in range(first_page, last_page + 1)}
+    remaining = list(found) if pages is None else sorted(pages)  # pages no engine has found tables on yet
+
+    for engine in table_order:
+        if not remaining:
+            break
+        if engine == "pymupdf" and PYMUPDF_TABLES_AVAILABLE:
+            # In-process; one document handle for the whole range. PyMuPDF isn't thread-safe,
+            # so process_pdf never runs this engine on its prefetch thread
+            try:
+                with fitz.open(pdf_path) as doc:
+                    for p in remaining:
+                        try:
+                            found[p] = _export_tables_pymupdf(doc, p, tables_dir, pretty=pretty)
+                        except Exception:
+                            found[p] = []
+            except Exception:
+                pass
+            remaining = [p for p in remaining if not found[p]]
+        elif engine == "camelot" and CAMELOT_AVAILABLE:
+            for flavor in ("lattice", "stream"):
+                if not remaining:
+                    break
+                try:
+                    import camelot  # local import
+                    tables = camelot.read_pdf(pdf_path, pages=",".join(map(str, remaining)), flavor=flavor, suppress_stdout=True)
+                except Exception:
+                    # Don't let one bad page sink the range: redo what's left page by page
+                    for p in remaining:
+                        try:
+                            found[p] = _extract_tables_page(pdf_path, p, table_order[table_order.index(engine):],
+                                                            tables_dir, pretty=pretty)
+                        except Exception:
+                            found[p] = []
+                    return found
+                for t in tables:
+                    page = int(t.page)
+                    if page not in found:
+                        continue
+                    table_index = len(found[page]) + 1
+                    xml_path = tables_dir / f"page_{page:06d}_table_{table_index:03d}.xml"
+                    try:
+                        t.to_xml(str(xml_path))
+                    except Exception:
+                        continue
+                    found[page].append({
+                        "engine": f"camelot-{flavor}",
+                        "path": str(xml_path),
+                        "index": table_index,
+                        "page": page
+                    })
+                remaining = [p for p in remaining if not found[p]]
+        elif engine == "tabula" and TABULA_AVAILABLE:
+            # tabula's multi-page results carry no page numbers, so it stays per page
+            for p in remaining:
+                try:
+                    found[p] = _extract_tables_page(pdf_path, p, ["tabula"], tables_dir, pretty=pretty)
+                except Exception:
+                    found[p] = []
+            remaining = [p for p in remaining if not found[p]]
+
+    return found
+
+
+def _metadata_element(input_pdf: str, total_pages: int, start_page: int, end_page: int) -> etree._Element:
+    meta = etree.Element("metadata")
     etree.SubElement(meta, "generator").text = "pdf_to_universal_xml"
     etree.SubElement(meta, "version").text = "1.0"
     etree.SubElement(meta, "timestamp").text = _now_iso()
@@ -199,8 +676,38 @@ def _build_xml_scaffold(input_pdf: str, total_pages: int, start_page: int, end_p
     etree.SubElement(file_meta, "pages").text = str(total_pages)
     etree.SubElement(file_meta, "start_page").text = str(start_page)
     etree.SubElement(file_meta, "end_page").text = str(end_page)
-    etree.SubElement(root, "content")
-    return etree.ElementTree(root)
+    return meta
+
+
+@contextlib.contextmanager
+def _xml_page_writer(xml_path: Path, input_pdf: str, total_pages: int, start_page: int, end_page: int,
+                     pretty: bool = False):
+    """
+    Stream combined.xml to disk with lxml's xmlfile, yielding write(page_element).
+    Only the page being written is held in memory. pretty=True lays it out
+    the same as pretty-printing a full <document> tree.
+    """
+    def ws(s):
+        return s if pretty else ""
+
+    xml_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(xml_path, "wb") as f:
+        with etree.xmlfile(f, encoding="utf-8") as xf:
+            xf.write_declaration()
+            with xf.element("document"):
+                meta = _metadata_element(input_pdf, total_pages, start_page, end_page)
+                if pretty:
+                    etree.indent(meta, level=1)
+                xf.write(ws("\n  "), meta, ws("\n  "))
+                with xf.element("content"):
+                    def write(page_el):
+                        if pretty:
+                            etree.indent(page_el, level=2)
+                        xf.write(ws("\n    "), page_el)
+                    yield write
+                    xf.write(ws("\n  "))
+                xf.write(ws("\n"))
+        f.write(b"\n")
 
 
 def _cleanup_old_sessions(output_dir: Path, max_sessions: int = 5, max_age_hours: float = 24.0) -> Dict[str, Any]:
@@ -215,9 +722,6 @@ def _cleanup_old_sessions(output_dir: Path, max_sessions: int = 5, max_age_hours
     Returns:
         Dict with cleanup statistics
     """
-    import time
-    import shutil
-    
     cleanup_stats = {
         "sessions_found": 0,
         "sessions_removed": 0,
@@ -230,41 +734,55 @@ def _cleanup_old_sessions(output_dir: Path, max_sessions: int = 5, max_age_hours
         if not output_dir.exists():
             return cleanup_stats
             
-        # Find all session directories
-        session_dirs = [d for d in output_dir.iterdir() 
-                       if d.is_dir() and d.name.startswith('session_')]
+        # Raster caches and the app's result cache are shared across sessions, so they only expire by age
+        for cache_root, label in ((output_dir / ".raster_cache", "raster_cache"), (output_dir / ".cache", "cache")):
+            if not cache_root.is_dir():
+                continue
+            for cache_dir in cache_root.iterdir():
+                try:
+                    if cache_dir.is_dir() and (time.time() - cache_dir.stat().st_mtime) / 3600 > max_age_hours:
+                        size_mb = _get_directory_size_mb(cache_dir)
+                        shutil.rmtree(cache_dir)
+                        cleanup_stats["space_freed_mb"] += size_mb
+                        cleanup_stats["cleanup_reason"].append(f"{label}/{cache_dir.name}:aged")
+                except Exception as e:
+                    cleanup_stats["cleanup_reason"].append(f"{label}/{cache_dir.name}:error_{str(e)[:50]}")
+
+        # One scandir pass; each session is stat'ed once for its mtime
+        with os.scandir(output_dir) as it:
+            sessions = [(entry.stat().st_mtime, entry.path) for entry in it
+                        if entry.name.startswith('session_') and entry.is_dir()]
         
-        cleanup_stats["sessions_found"] = len(session_dirs)
+        cleanup_stats["sessions_found"] = len(sessions)
         
-        if len(session_dirs) <= 1:  # Keep at least current session
-            cleanup_stats["sessions_kept"] = len(session_dirs)
+        if len(sessions) <= 1:  # Keep at least current session
+            cleanup_stats["sessions_kept"] = len(sessions)
             return cleanup_stats
         
         # Sort by modification time (newest first)
-        session_dirs.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        sessions.sort(reverse=True)
         
         current_time = time.time()
         sessions_to_remove = []
         
-        # Strategy 1: Remove sessions older than max_age_hours
-        for session_dir in session_dirs:
-            age_hours = (current_time - session_dir.stat().st_mtime) / 3600
+        # Remove sessions older than max_age_hours, then keep only the max_sessions newest of the rest
+        for rank, (mtime, path) in enumerate(sessions):
+            age_hours = (current_time - mtime) / 3600
             if age_hours > max_age_hours:
-                sessions_to_remove.append((session_dir, f"aged_{age_hours:.1f}h"))
+                sessions_to_remove.append((Path(path), f"aged_{age_hours:.1f}h"))
+            elif rank >= max_sessions:
+                sessions_to_remove.append((Path(path), "excess_count"))
         
-        # Strategy 2: Keep only max_sessions newest sessions
-        if len(session_dirs) > max_sessions:
-            excess_sessions = session_dirs[max_sessions:]
-            for session_dir in excess_sessions:
-                if not any(s[0] == session_dir for s in sessions_to_remove):
-                    sessions_to_remove.append((session_dir, "excess_count"))
-        
-        # Remove identified sessions
-        for session_dir, reason in sessions_to_remove:
+        # Size all doomed sessions up front; the stat walks are I/O-bound and overlap well
+        if len(sessions_to_remove) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(sessions_to_remove))) as pool:
+                sizes = list(pool.map(_get_directory_size_mb, [s for s, _ in sessions_to_remove]))
+        else:
+            sizes = [_get_directory_size_mb(s) for s, _ in sessions_to_remove]
+
+        # Remove identified sessions (serially: parallel rmtree on one volume doesn't help)
+        for (session_dir, reason), size_mb in zip(sessions_to_remove, sizes):
             try:
-                # Calculate size before removal
-                size_mb = _get_directory_size_mb(session_dir)
-                
                 shutil.rmtree(session_dir)
                 cleanup_stats["sessions_removed"] += 1
                 cleanup_stats["space_freed_mb"] += size_mb
@@ -284,28 +802,39 @@ def _cleanup_old_sessions(output_dir: Path, max_sessions: int = 5, max_age_hours
 
 def _get_directory_size_mb(directory: Path) -> float:
     """Calculate total size of directory in MB."""
+    # scandir entries carry their file type, so only regular files need a stat call
     total_size = 0
-    try:
-        for path in directory.rglob('*'):
-            if path.is_file():
-                total_size += path.stat().st_size
-    except Exception:
-        pass
+    pending = [str(directory)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            total_size += entry.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
     return total_size / (1024 * 1024)
 
 
-def _append_page(tree: etree._ElementTree, page_index: int, text: str, images: List[Dict[str, Any]], tables: List[Dict[str, Any]]):
-    root = tree.getroot()
-    content = root.find("content")
-    p = etree.SubElement(content, "page", index=str(page_index + 1))
+def _page_element(page_index: int, text: str, images: List[Dict[str, Any]], tables: List[Dict[str, Any]]) -> etree._Element:
+    p = etree.Element("page", index=str(page_index + 1))
 
     txt_el = etree.SubElement(p, "text")
-    import re
-    def clean_xml_text(s):
-        # Remove all control characters except tab(\t), newline(\n), carriage return(\r)
-        return re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', s)
-    cleaned_text = clean_xml_text((text or "").replace("\r", "").strip())
-    txt_el.text = etree.CDATA(cleaned_text)
+    text = text or ""
+    if "\r" in text:
+        text = text.replace("\r", "")
+    text = text.strip()
+    cleaned_text = text.translate(_XML_INVALID_TRANS) if text.isascii() else _XML_INVALID_CHARS.sub("", text)
+    # CDATA only pays off when there is markup to escape, and it can't carry "]]>"
+    if "]]>" not in cleaned_text and any(c in cleaned_text for c in "<>&"):
+        txt_el.text = etree.CDATA(cleaned_text)
+    else:
+        txt_el.text = cleaned_text
 
     if images:
         imgs_el = etree.SubElement(p, "images")
@@ -321,6 +850,7 @@ def _append_page(tree: etree._ElementTree, page_index: int, text: str, images: L
             etree.SubElement(tbls_el, "table_ref",
                              engine=t.get("engine", "unknown"),
                              path=t["path"])
+    return p
 
 
 def process_pdf(
@@ -329,12 +859,21 @@ def process_pdf(
     start_page: int = 1,
     end_page: int = 0,
     ocr_threshold: int = 40,
-    dpi: int = 300,
+    dpi: int = OCR_DEFAULT_DPI,
+    ocr_retry_dpi: int = 0,  # re-OCR pages whose text stays under ocr_threshold at this higher DPI; 0 = off
     ocr_lang: str = "eng",
-    ocr_psm: str = "3",
+    ocr_psm: str = "6",
     ocr_oem: str = "3",
     table_order: Optional[List[str]] = None,
+    use_tesserocr: bool = True,
+    batch_ocr: bool = False,
+    ocr_workers: int = 1,
+    num_workers: int = 1,  # >1 splits the page range across worker processes
+    pretty: bool = False,  # indent combined.xml and table XML for reading
     progress_cb: Optional[callable] = None,  # for Streamlit progress
+    raster_cache: bool = False,  # keep OCR page rasters for re-runs of the same PDF
+    raster_cache_dir: Optional[str] = None,  # defaults to outdir/.raster_cache
+    pdf_key: Optional[str] = None,  # _pdf_fingerprint of input_pdf, when the caller already has it
     auto_cleanup: bool = False,
     max_sessions: int = 5,
     max_age_hours: float = 24.0,
@@ -342,15 +881,30 @@ def process_pdf(
     """
     Streaming processor. Returns manifest dict.
     """
-    table_order = table_order or ["camelot", "tabula"]
+    table_order = table_order or ["pymupdf", "camelot", "tabula"]
     out_dir = Path(outdir)
+    # Rasters only ever feed OCR
+    raster_cache = raster_cache and OCR_AVAILABLE and ocr_threshold > 0
+
+    if num_workers > 1:
+        if raster_cache and pdf_key is None:
+            try:
+                pdf_key = _pdf_fingerprint(input_pdf)  # once here rather than in every shard
+            except OSError:
+                raster_cache = False
+        params = {
+            "start_page": start_page, "end_page": end_page, "ocr_threshold": ocr_threshold, "dpi": dpi,
+            "ocr_retry_dpi": ocr_retry_dpi, "ocr_lang": ocr_lang, "ocr_psm": ocr_psm, "ocr_oem": ocr_oem, "table_order": table_order,
+            "use_tesserocr": use_tesserocr, "batch_ocr": batch_ocr, "ocr_workers": ocr_workers,
+            "pretty": pretty, "raster_cache": raster_cache, "pdf_key": pdf_key,
+        }
+        return _process_pdf_sharded(input_pdf, outdir, num_workers, params, auto_cleanup=auto_cleanup,
+                                    max_sessions=max_sessions, max_age_hours=max_age_hours,
+                                    progress_cb=progress_cb, raster_cache_dir=raster_cache_dir)
     
     # Create session-based directory structure to prevent cross-contamination
-    import time
-    import hashlib
-    
     # Generate unique session ID based on input file and timestamp
-    session_id = hashlib.md5(f"{input_pdf}_{time.time()}_{start_page}_{end_page}".encode()).hexdigest()[:12]
+    session_id = hashlib.blake2b(f"{input_pdf}_{time.time()}_{start_page}_{end_page}".encode(), digest_size=6).hexdigest()
     
     # Create session-specific subdirectories
     session_dir = out_dir / f"session_{session_id}"
@@ -358,7 +912,6 @@ def process_pdf(
     images_dir = session_dir / "assets" / "images"
     
     # Clear and recreate directories to ensure clean state
-    import shutil
     if session_dir.exists():
         shutil.rmtree(session_dir)
         
@@ -369,7 +922,23 @@ def process_pdf(
     # Also ensure main output directory exists
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    # Page rasters are reused across runs that only change OCR settings
+    raster_dir = None
+    if raster_cache:
+        try:
+            raster_dir = Path(raster_cache_dir or out_dir / ".raster_cache") / (pdf_key or _pdf_fingerprint(input_pdf))
+            if raster_dir.exists():
+                os.utime(raster_dir)  # keeps a cache in use from aging out
+        except Exception:
+            raster_dir = None
+
     doc = fitz.open(input_pdf)
+    ocr_api = None  # created on the first OCR page, then reused for the whole run
+    ocr_api_tried = False
+    worker_pool = None  # render and tesseract processes, created on the first parallel OCR window
+    table_pool = None  # extracts the next table batch while the current pages are OCR'd
+    tables_next = None  # the following window, started by start_tables_window
+    xml_out = contextlib.ExitStack()
     try:
         total_pages = doc.page_count
         if end_page <= 0 or end_page > total_pages:
@@ -377,44 +946,198 @@ def process_pdf(
         if start_page < 1:
             start_page = 1
 
-        xml_tree = _build_xml_scaffold(input_pdf, total_pages, start_page, end_page)
+        # Pages go to disk as they're produced instead of accumulating in one big tree
+        xml_path = session_dir / "combined.xml"
+        write_page = xml_out.enter_context(_xml_page_writer(xml_path, input_pdf, total_pages, start_page, end_page,
+                                                            pretty=pretty))
 
         stats = {"pages": 0, "ocr_pages": 0, "images": 0, "tables": 0}
 
         num_pages_to_do = end_page - start_page + 1
+        # Without tesserocr every OCR call goes through the binary; don't render pages it can't read
+        ocr_enabled = ocr_threshold > 0 and _ocr_deps() and (
+            (use_tesserocr and TESSEROCR_AVAILABLE) or _tesseract_info()["available"])
+        # Resolved once so text-only runs skip the table windows entirely
+        tables_enabled = any((engine == "pymupdf" and PYMUPDF_TABLES_AVAILABLE) or
+                             (engine == "camelot" and CAMELOT_AVAILABLE) or (engine == "tabula" and TABULA_AVAILABLE)
+                             for engine in table_order)
+        # PyMuPDF doesn't support threads: a leading pymupdf engine runs here, and only the engines
+        # after it go to the prefetch thread, on the pages it found nothing on, overlapping tesseract
+        tables_head = table_order[:1] if PYMUPDF_TABLES_AVAILABLE and table_order[:1] == ["pymupdf"] else []
+        tables_tail = table_order[len(tables_head):]
+        tables_prefetch = ocr_enabled and not (PYMUPDF_TABLES_AVAILABLE and "pymupdf" in tables_tail)
+        ocr_batch_dir = session_dir / ".ocr_batch"
+        pending = []  # pages held back (in order) until their deferred OCR pass completes
+        pending_ocr = 0  # how many of them are waiting on OCR
+        tables_by_page = {}  # current batch of table extraction results, by 1-based page
+        defer_ocr = batch_ocr or ocr_workers > 1
+        ocr_window = max(OCR_BATCH_SIZE, ocr_workers)
+        # Text pages queued behind an OCR page wait too; cap them so a lone early scan
+        # doesn't hold the rest of the document (and the progress bar) until the end
+        pending_cap = 2 * ocr_window
+
+        def start_tables_window(first):
+            nonlocal table_pool
+            last = min(first + TABLE_BATCH_PAGES - 1, end_page)
+            found = {p: [] for p in range(first, last + 1)}
+            if tables_head:
+                try:
+                    found = _extract_tables_range(input_pdf, first, last, tables_head, tables_dir, pretty=pretty)
+                except Exception:
+                    pass
+            misses = [p for p, tbls in found.items() if not tbls]
+            fut = None
+            if tables_prefetch and tables_tail and misses:
+                if table_pool is None:
+                    table_pool = ThreadPoolExecutor(max_workers=1)
+                fut = table_pool.submit(_extract_tables_range, input_pdf, first, last, tables_tail, tables_dir,
+                                        pretty=pretty, pages=misses)
+            return {"first": first, "last": last, "found": found, "misses": misses, "future": fut}
+
+        def finish_tables_window(window):
+            rest = None
+            if window["future"] is not None:
+                try:
+                    rest = window["future"].result()
+                except Exception:
+                    pass
+            if rest is None and tables_tail and window["misses"]:
+                # Not prefetched, or the prefetch failed: run the remaining engines here
+                try:
+                    rest = _extract_tables_range(input_pdf, window["first"], window["last"], tables_tail,
+                                                 tables_dir, pretty=pretty, pages=window["misses"])
+                except Exception:
+                    pass
+            found = window["found"]
+            for p in window["misses"]:
+                found[p] = (rest or {}).get(p, [])
+            return found
+
+        def emit_page(idx, text, did_ocr, imgs, tbls):
+            write_page(_page_element(idx, text, imgs, tbls))
+            stats["pages"] += 1
+            if did_ocr:
+                stats["ocr_pages"] += 1
+            if progress_cb:
+                progress_cb(stats["pages"], num_pages_to_do)
+
+        def get_worker_pool():
+            nonlocal worker_pool
+            if worker_pool is None:
+                # Processes, not threads: the OpenMP limit then reaches tesseract
+                # through the workers' environment without touching this process's
+                worker_pool = ProcessPoolExecutor(max_workers=ocr_workers, initializer=_limit_omp_threads)
+            return worker_pool
+
+        def ocr_files(paths):
+            pool = None
+            if ocr_workers > 1:
+                try:
+                    pool = get_worker_pool()
+                except Exception:
+                    pass
+            return _ocr_image_files(paths, lang=ocr_lang, psm=ocr_psm, oem=ocr_oem,
+                                    batch=batch_ocr, workers=ocr_workers, pool=pool)
+
+        def render_pending(jobs, render_dpi):
+            ocr_batch_dir.mkdir(parents=True, exist_ok=True)
+            if ocr_workers > 1 and len(jobs) > 1:
+                # Rasterization is CPU-bound and PyMuPDF documents are not thread-safe:
+                # fan the window out over processes, each opening its own handle
+                try:
+                    size = math.ceil(len(jobs) / ocr_workers)
+                    futures = [get_worker_pool().submit(_render_ocr_images, input_pdf, jobs[i:i + size], render_dpi, raster_dir)
+                               for i in range(0, len(jobs), size)]
+                    for fut in futures:
+                        fut.result()
+                    return
+                except Exception:
+                    pass
+            for idx, png_path in jobs:
+                _preprocess_for_ocr(_cached_page_image(doc[idx], dpi=render_dpi, cache_dir=raster_dir)).save(png_path)
+
+        def flush_pending():
+            nonlocal pending_ocr
+            jobs = [(p["idx"], p["ocr_image"]) for p in pending if p["ocr_image"] is not None]
+            render_pending(jobs, dpi)
+            ocr_texts = ocr_files([path for _, path in jobs])
+            retry = [i for i, t in enumerate(ocr_texts) if len(t.strip()) < ocr_threshold] if ocr_retry_dpi > dpi else []
+            if retry:
+                # Short results may just be small print: one more pass at the retry DPI for those pages
+                retry_jobs = [(jobs[i][0], jobs[i][1].with_name(f"{jobs[i][1].stem}_retry.png")) for i in retry]
+                render_pending(retry_jobs, ocr_retry_dpi)
+                retry_texts = ocr_files([path for _, path in retry_jobs])
+                for i, t in zip(retry, retry_texts):
+                    if len(t.strip()) > len(ocr_texts[i].strip()):
+                        ocr_texts[i] = t
+            ocr_texts = iter(ocr_texts)
+            for p in pending:
+                text, did_ocr = p["text"], False
+                if p["ocr_image"] is not None:
+                    ocr_txt = next(ocr_texts)
+                    if len(ocr_txt.strip()) > p["text_len"]:
+                        text, did_ocr = ocr_txt, True
+                emit_page(p["idx"], text, did_ocr, p["imgs"], p["tbls"])
+            pending.clear()
+            pending_ocr = 0
+            shutil.rmtree(ocr_batch_dir, ignore_errors=True)
+
+        n_images = n_tables = 0  # loop-local tallies, folded into stats after the loop
         for idx in range(start_page - 1, end_page):
             page = doc[idx]
 
             text = page.get_text("text") or ""
             did_ocr = False
-            if (len(text.strip()) < ocr_threshold) and OCR_AVAILABLE:
-                pil_img = _page_to_image(page, dpi=dpi)
-                ocr_txt = _ocr_image(pil_img, lang=ocr_lang, psm=ocr_psm, oem=ocr_oem)
-                if len(ocr_txt.strip()) > len(text.strip()):
-                    text = ocr_txt
-                    did_ocr = True
+            ocr_image = None
+            text_len = len(text.strip()) if ocr_enabled else 0  # stripped length, computed once per page
+            if ocr_enabled and text_len < ocr_threshold and _needs_ocr(page):
+                if use_tesserocr and not ocr_api_tried:
+                    ocr_api = _open_tess_api(lang=ocr_lang, psm=ocr_psm, oem=ocr_oem)
+                    ocr_api_tried = True
+                if defer_ocr and ocr_api is None:
+                    # Defer rendering + OCR to a batched and/or parallel pass over the next window of pages
+                    ocr_image = ocr_batch_dir / f"page_{idx+1:06d}.png"
+                else:
+                    pil_img = _cached_page_image(page, dpi=dpi, cache_dir=raster_dir)
+                    ocr_txt = _ocr_image(pil_img, lang=ocr_lang, psm=ocr_psm, oem=ocr_oem, api=ocr_api)
+                    if ocr_retry_dpi > dpi and len(ocr_txt.strip()) < ocr_threshold:
+                        # Short result; small print may just need more pixels
+                        retry_txt = _ocr_image(_cached_page_image(page, dpi=ocr_retry_dpi, cache_dir=raster_dir),
+                                               lang=ocr_lang, psm=ocr_psm, oem=ocr_oem, api=ocr_api)
+                        if len(retry_txt.strip()) > len(ocr_txt.strip()):
+                            ocr_txt = retry_txt
+                    if len(ocr_txt.strip()) > text_len:
+                        text = ocr_txt
+                        did_ocr = True
 
             imgs = _extract_embedded_images(doc, page, idx, images_dir)
-            stats["images"] += len(imgs)
-
-            tbls = []
-            try:
-                tbls = _extract_tables_page(input_pdf, idx + 1, table_order, tables_dir)
-            except Exception:
-                tbls = []
-            stats["tables"] += len(tbls)
+            n_images += len(imgs)
 
-            _append_page(xml_tree, idx, text, imgs, tbls)
+            if tables_enabled and idx + 1 not in tables_by_page:
+                # Tables come in TABLE_BATCH_PAGES windows; while this one's pages wait on tesseract,
+                # the next window's fallback engines already run on the prefetch thread
+                window = tables_next if tables_next is not None and tables_next["first"] == idx + 1 else None
+                tables_next = None
+                tables_by_page = finish_tables_window(window or start_tables_window(idx + 1))
+                next_first = max(tables_by_page) + 1
+                if tables_prefetch and next_first <= end_page:
+                    tables_next = start_tables_window(next_first)
+            tbls = tables_by_page.get(idx + 1, [])
+            n_tables += len(tbls)
 
-            stats["pages"] += 1
-            if did_ocr:
-                stats["ocr_pages"] += 1
-
-            if progress_cb:
-                progress_cb(stats["pages"], num_pages_to_do)
+            if ocr_image is not None or pending:
+                pending.append({"idx": idx, "text": text, "text_len": text_len, "ocr_image": ocr_image,
+                                "imgs": imgs, "tbls": tbls})
+                pending_ocr += ocr_image is not None
+                if pending_ocr >= ocr_window or len(pending) >= pending_cap:
+                    flush_pending()
+            else:
+                emit_page(idx, text, did_ocr, imgs, tbls)
 
-        xml_path = session_dir / "combined.xml"
-        _safe_write_bytes(xml_path, etree.tostring(xml_tree, pretty_print=True, encoding="utf-8", xml_declaration=True))
+        if pending:
+            flush_pending()
+        xml_out.close()
+        stats["images"], stats["tables"] = n_images, n_tables
 
         manifest = {
             "input": os.path.abspath(input_pdf),
@@ -430,22 +1153,38 @@ def process_pdf(
             "tables_extracted": stats["tables"],
             "started": _now_iso(),
             "finished": _now_iso(),
-            "ocr_available": OCR_AVAILABLE,
+            # The import/tesseract probes only ran (and are cached) if OCR was on; don't pay for them otherwise
+            "ocr_available": _ocr_deps() if ocr_enabled else OCR_AVAILABLE,
             "camelot_available": CAMELOT_AVAILABLE,
             "tabula_available": TABULA_AVAILABLE,
+            "pymupdf_tables_available": PYMUPDF_TABLES_AVAILABLE,
+            "tesserocr_available": TESSEROCR_AVAILABLE,
+            "tesseract_version": _tesseract_info().get("version") if ocr_enabled else None,
             "params": {
                 "start_page": start_page,
                 "end_page": end_page,
                 "ocr_threshold": ocr_threshold,
                 "dpi": dpi,
+                "ocr_retry_dpi": ocr_retry_dpi,
                 "ocr_lang": ocr_lang,
                 "ocr_psm": ocr_psm,
                 "ocr_oem": ocr_oem,
                 "table_order": table_order,
+                "use_tesserocr": use_tesserocr,
+                "batch_ocr": batch_ocr,
+                "ocr_workers": ocr_workers,
+                "pretty": pretty,
+                "raster_cache": raster_cache,
             },
         }
 
-        _safe_write_text(out_dir / "manifest.json", json.dumps(manifest, indent=2))
+        _safe_write_text(out_dir / "manifest.json", _manifest_json(manifest, pretty=pretty))
+
+        if raster_dir is not None:
+            try:
+                _trim_raster_cache(raster_dir.parent, keep=raster_dir)
+            except OSError:
+                pass
         
         # Optional: Clean up old sessions automatically (only if enabled)
         cleanup_stats = {}
@@ -459,7 +1198,164 @@ def process_pdf(
         
     finally:
         # Always close the PDF document to free resources
+        xml_out.close()
         doc.close()
+        if ocr_api is not None:
+            ocr_api.End()
+        if worker_pool is not None:
+            worker_pool.shutdown()
+        if table_pool is not None:
+            # By hand rather than shutdown(cancel_futures=True), which needs Python 3.9
+            if tables_next is not None and tables_next["future"] is not None:
+                tables_next["future"].cancel()
+            table_pool.shutdown()
+
+
+def _split_page_range(start: int, end: int, n: int):
+    """Split [start, end] into at most n contiguous (start, end) shards."""
+    total = end - start + 1
+    n = max(1, min(n, total))
+    size, extra = divmod(total, n)
+    shards = []
+    first = start
+    for i in range(n):
+        last = first + size - 1 + (1 if i < extra else 0)
+        shards.append((first, last))
+        first = last + 1
+    return shards
+
+
+def _run_shard(progress_q, shard_no: int, **kwargs) -> Dict[str, Any]:
+    """Worker entry point: process_pdf on one shard, reporting pages done through progress_q."""
+    if progress_q is not None:
+        kwargs["progress_cb"] = lambda done, total: progress_q.put((shard_no, done))
+    return process_pdf(**kwargs)
+
+
+def _process_pdf_sharded(input_pdf: str, outdir: str, num_workers: int, params: Dict[str, Any],
+                         auto_cleanup: bool, max_sessions: int, max_age_hours: float,
+                         progress_cb: Optional[callable] = None,
+                         raster_cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run process_pdf over page-range shards in a process pool and merge the
+    shard outputs into a single session, laid out exactly like a serial run.
+    """
+    out_dir = Path(outdir)
+    with fitz.open(input_pdf) as doc:
+        total_pages = doc.page_count
+    start_page = max(1, params["start_page"])
+    end_page = params["end_page"]
+    if end_page <= 0 or end_page > total_pages:
+        end_page = total_pages
+
+    shards = _split_page_range(start_page, end_page, num_workers)
+    num_pages_to_do = end_page - start_page + 1
+    session_id = hashlib.blake2b(f"{input_pdf}_{time.time()}_{start_page}_{end_page}_sharded".encode(), digest_size=6).hexdigest()
+    shard_root = out_dir / f".shards_{session_id}"
+
+    started = _now_iso()
+    shard_manifests = {}
+    xml_out = contextlib.ExitStack()
+    shard_done = [0] * len(shards)
+    try:
+        # Shards already keep every worker busy: nested OCR pools would only oversubscribe the cores
+        ocr_workers = params["ocr_workers"] if len(shards) == 1 else 1
+        with contextlib.ExitStack() as pools:
+            # Shards report each page back here, so progress moves during a shard, not only between them
+            progress_q = pools.enter_context(Manager()).Queue() if progress_cb else None
+            # Tesseract's own OpenMP threads would oversubscribe the cores next to the other shards
+            pool = pools.enter_context(ProcessPoolExecutor(max_workers=len(shards), initializer=_limit_omp_threads))
+            futures = {}
+            for i, (first, last) in enumerate(shards):
+                shard_params = dict(params, start_page=first, end_page=last, ocr_workers=ocr_workers)
+                fut = pool.submit(_run_shard, progress_q, i, input_pdf=input_pdf, outdir=str(shard_root / f"shard_{i}"),
+                                  raster_cache_dir=raster_cache_dir or str(out_dir / ".raster_cache"), **shard_params)
+                futures[fut] = i
+            running = set(futures)
+            while running:
+                finished, running = wait(running, timeout=0.25, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    m = fut.result()
+                    shard_manifests[futures[fut]] = m
+                    shard_done[futures[fut]] = m["pages_processed"]
+                if progress_cb:
+                    try:
+                        while True:
+                            i, n = progress_q.get_nowait()
+                            if i not in shard_manifests:
+                                shard_done[i] = max(shard_done[i], n)
+                    except Empty:
+                        pass
+                    progress_cb(sum(shard_done), num_pages_to_do)
+
+        session_dir = out_dir / f"session_{session_id}"
+        tables_dir = session_dir / "tables"
+        images_dir = session_dir / "assets" / "images"
+        tables_dir.mkdir(parents=True, exist_ok=True)
+        images_dir.mkdir(parents=True, exist_ok=True)
+
+        xml_path = session_dir / "combined.xml"
+        stats = {"pages": 0, "ocr_pages": 0, "images": 0, "tables": 0}
+        write_page = xml_out.enter_context(_xml_page_writer(xml_path, input_pdf, total_pages, start_page, end_page,
+                                                            pretty=params.get("pretty", False)))
+
+        for i in range(len(shards)):
+            m = shard_manifests[i]
+            stats["pages"] += m["pages_processed"]
+            stats["ocr_pages"] += m["pages_ocr"]
+            stats["images"] += m["images_extracted"]
+            stats["tables"] += m["tables_extracted"]
+
+            # File names carry the page number, so shards never collide
+            for src in Path(m["tables_dir"]).iterdir():
+                shutil.move(str(src), str(tables_dir / src.name))
+            for src in Path(m["images_dir"]).iterdir():
+                shutil.move(str(src), str(images_dir / src.name))
+
+            for _, page in etree.iterparse(m["xml"], tag="page", remove_blank_text=True, strip_cdata=False):
+                for im in page.iter("image"):
+                    im.set("path", str(images_dir / Path(im.get("path")).name))
+                for t in page.iter("table_ref"):
+                    t.set("path", str(tables_dir / Path(t.get("path")).name))
+                write_page(page)
+                # Written out: drop it so the shard's parse tree stays empty
+                page.getparent().remove(page)
+        xml_out.close()
+    finally:
+        xml_out.close()
+        shutil.rmtree(shard_root, ignore_errors=True)
+
+    first_manifest = shard_manifests[0]
+    manifest = {
+        "input": os.path.abspath(input_pdf),
+        "output_dir": str(out_dir),
+        "session_dir": str(session_dir),
+        "session_id": session_id,
+        "xml": str(xml_path),
+        "tables_dir": str(tables_dir),
+        "images_dir": str(images_dir),
+        "pages_processed": stats["pages"],
+        "pages_ocr": stats["ocr_pages"],
+        "images_extracted": stats["images"],
+        "tables_extracted": stats["tables"],
+        "started": started,
+        "finished": _now_iso(),
+        "ocr_available": first_manifest["ocr_available"],
+        "camelot_available": first_manifest["camelot_available"],
+        "tabula_available": first_manifest["tabula_available"],
+        "pymupdf_tables_available": first_manifest.get("pymupdf_tables_available", False),
+        "tesserocr_available": first_manifest.get("tesserocr_available", False),
+        "tesseract_version": first_manifest.get("tesseract_version"),
+        "params": dict(first_manifest["params"], start_page=start_page, end_page=end_page),
+        "shards": len(shards),
+    }
+    _safe_write_text(out_dir / "manifest.json", _manifest_json(manifest, pretty=params.get("pretty", False)))
+
+    cleanup_stats = {}
+    if auto_cleanup:
+        cleanup_stats = _cleanup_old_sessions(out_dir, max_sessions=max_sessions, max_age_hours=max_age_hours)
+    manifest["cleanup_stats"] = cleanup_stats
+    return manifest
 
 
 # CLI entry (optional)
@@ -470,17 +1366,27 @@ def _parse_args():
     ap.add_argument("--start-page", type=int, default=1)
     ap.add_argument("--end-page", type=int, default=0)
     ap.add_argument("--ocr-threshold", type=int, default=40)
-    ap.add_argument("--dpi", type=int, default=300)
+    ap.add_argument("--dpi", type=int, default=OCR_DEFAULT_DPI, help="OCR render DPI (raise for very small print)")
+    ap.add_argument("--ocr-retry-dpi", type=int, default=0,
+                    help="Re-OCR pages that still come back under the OCR threshold at this higher DPI (e.g. 300; 0 = off)")
     ap.add_argument("--ocr-lang", type=str, default="eng")
-    ap.add_argument("--ocr-psm", type=str, default="3")
+    ap.add_argument("--ocr-psm", type=str, default="6", help="Tesseract page segmentation mode (6 = single uniform block; 3 = full auto layout)")
     ap.add_argument("--ocr-oem", type=str, default="3")
-    ap.add_argument("--tables", type=str, default="camelot,tabula")
+    ap.add_argument("--tables", type=str, default="pymupdf,camelot,tabula")
+    ap.add_argument("--no-tesserocr", action="store_true", help="Always OCR through the pytesseract CLI wrapper")
+    ap.add_argument("--batch-ocr", action="store_true", help="OCR pages in batches with one tesseract run each")
+    ap.add_argument("--ocr-workers", type=int, default=1, help="Parallel tesseract runs for OCR pages")
+    ap.add_argument("--pretty", action="store_true", help="Indent the XML output for reading")
+    ap.add_argument("--raster-cache", action="store_true",
+                    help=f"Keep OCR page rasters in OUTDIR/.raster_cache for re-runs (capped at {RASTER_CACHE_MAX_MB} MB)")
+    ap.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4),
+                    help="Worker processes, each extracting its own slice of the page range")
     return ap.parse_args()
 
 
 def main():
     args = _parse_args()
-    table_order = [t.strip().lower() for t in args.tables.split(",") if t.strip() in ("camelot", "tabula")]
+    table_order = [t.strip().lower() for t in args.tables.split(",") if t.strip() in ("pymupdf", "camelot", "tabula")]
     manifest = process_pdf(
         input_pdf=args.input,
         outdir=args.outdir,
@@ -488,10 +1394,17 @@ def main():
         end_page=args.end_page,
         ocr_threshold=args.ocr_threshold,
         dpi=args.dpi,
+        ocr_retry_dpi=args.ocr_retry_dpi,
         ocr_lang=args.ocr_lang,
         ocr_psm=args.ocr_psm,
         ocr_oem=args.ocr_oem,
-        table_order=table_order or ["camelot", "tabula"],
+        table_order=table_order or ["pymupdf", "camelot", "tabula"],
+        use_tesserocr=not args.no_tesserocr,
+        batch_ocr=args.batch_ocr,
+        ocr_workers=max(1, args.ocr_workers),
+        num_workers=max(1, args.workers),
+        pretty=args.pretty,
+        raster_cache=args.raster_cache,
     )
     print(json.dumps(manifest, indent=2))
 
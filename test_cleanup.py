@@ -7,6 +7,7 @@ This script creates fake session directories and tests the cleanup logic.
 """
 
 import os
+import sys
 import time
 import json
 from pathlib import Path
@@ -31,6 +32,18 @@ def create_test_session(output_dir: Path, session_id: str, age_hours: float = 0)
     
     return session_dir
 
+def create_test_cache_entry(output_dir: Path, cache_name: str, entry: str, age_hours: float = 0):
+    """Create an entry under a shared cache directory (.raster_cache or .cache)."""
+    entry_dir = output_dir / cache_name / entry
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    (entry_dir / "000000_220.png").write_bytes(b"fake raster data")
+    
+    if age_hours > 0:
+        target_time = time.time() - (age_hours * 3600)
+        os.utime(entry_dir, (target_time, target_time))
+    
+    return entry_dir
+
 def main():
     print("🧪 Testing Cleanup Functionality")
     print("=" * 50)
@@ -110,12 +123,54 @@ def main():
             age_hours = age_seconds / 3600
             print(f"   - {session_dir.name} (age: {age_hours:.1f}h)")
         
+        # Test 3: Shared caches expire by age only, next to the sessions
+        print("\n7. Testing cache expiry (.raster_cache and .cache, 24h age limit)...")
+        caches = [
+            (".raster_cache", "oldpdf", 30),  # should be cleaned
+            (".raster_cache", "newpdf", 1),   # younger than the cutoff
+            (".cache", "oldkey", 48),         # should be cleaned
+            (".cache", "newkey", 0),          # younger than the cutoff
+        ]
+        for cache_name, entry, age in caches:
+            create_test_cache_entry(test_dir, cache_name, entry, age)
+        cleanup_stats = _cleanup_old_sessions(test_dir, max_sessions=5, max_age_hours=24.0)
+        
+        remaining_caches = sorted(f"{d.parent.name}/{d.name}" for name in (".raster_cache", ".cache")
+                                  for d in (test_dir / name).iterdir())
+        print(f"   - Remaining cache entries: {remaining_caches}")
+        assert remaining_caches == [".cache/newkey", ".raster_cache/newpdf"], remaining_caches
+        assert "raster_cache/oldpdf:aged" in cleanup_stats["cleanup_reason"], cleanup_stats["cleanup_reason"]
+        assert "cache/oldkey:aged" in cleanup_stats["cleanup_reason"], cleanup_stats["cleanup_reason"]
+        assert cleanup_stats["space_freed_mb"] > 0
+        
+        # Test 4: Age and max-sessions together, newest first
+        print("\n8. Testing combined age and count eviction (max 2 sessions, 24h age limit)...")
+        import shutil
+        shutil.rmtree(test_dir)
+        test_dir.mkdir()
+        for session_id, age in [("s0", 0), ("s1", 1), ("s2", 2), ("s3", 3), ("aged", 30)]:
+            create_test_session(test_dir, session_id, age)
+        cleanup_stats = _cleanup_old_sessions(test_dir, max_sessions=2, max_age_hours=24.0)
+        
+        remaining_sessions = sorted(d.name for d in test_dir.iterdir() if d.name.startswith('session_'))
+        print(f"   - Remaining sessions: {remaining_sessions}")
+        print(f"   - Cleanup reasons: {cleanup_stats['cleanup_reason']}")
+        assert remaining_sessions == ["session_s0", "session_s1"], remaining_sessions
+        assert cleanup_stats["cleanup_reason"] == [
+            "session_s2:excess_count",
+            "session_s3:excess_count",
+            "session_aged:aged_30.0h",
+        ], cleanup_stats["cleanup_reason"]
+        assert (cleanup_stats["sessions_found"], cleanup_stats["sessions_removed"], cleanup_stats["sessions_kept"]) == (5, 3, 2)
+        
         print("\n✅ Cleanup functionality test completed successfully!")
+        return 0
         
     except Exception as e:
         print(f"\n❌ Test failed with error: {e}")
         import traceback
         traceback.print_exc()
+        return 1
     
     finally:
         # Clean up test directory
@@ -125,4 +180,4 @@ def main():
             print(f"\n🧹 Test directory cleaned up")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())